@@ -1,28 +1,113 @@
 from __future__ import annotations
 
 import os
+import re
+import csv
+import json
+import time
+import random
+import sqlite3
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 
-import pandas as pd
+import httplib2
 
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 # We only need read-only access
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
+# Jobs live in SQLite; jobs.csv is a human-editable export whose edits are
+# read back on the next run. A jobs.csv from older versions is migrated on first run.
+JOBS_DB = Path("jobs.db")
 JOBS_CSV = Path("jobs.csv")
 
+EXPECTED_COLS = (
+    "company",
+    "role_title",
+    "job_link",
+    "applied_date",
+    "status",
+    "job_text",
+    "summary",
+    "skills",
+    "salary",
+    "job_description",
+)
+
+# Remembers where each scan left off so later runs only look at new mail
+SYNC_STATE_PATH = Path("sync_state.json")
+
+# Gmail message IDs each scan has already handled, so re-runs skip fetching them
+PROCESSED_IDS_PATH = Path("processed_ids.json")
+
+# Phrases identifying confirmation (subject only) and rejection emails
+CONFIRM_TERMS = (
+    "application received",
+    "thank you for applying",
+    "we received your application",
+    "your application has been submitted",
+)
+REJECT_TERMS = (
+    "regret to inform you",
+    "decided not to move forward",
+    "unfortunately we will not be moving forward",
+    "after careful consideration, we have decided",
+)
+QUERY_CONFIRM_TERMS = "subject:(" + " OR ".join(f'"{t}"' for t in CONFIRM_TERMS) + ")"
+QUERY_REJECT_TERMS = "(" + " OR ".join(f'"{t}"' for t in REJECT_TERMS) + ")"
+
+
+def _phrase_pattern(terms) -> re.Pattern:
+    """
+    Match any of `terms` the way Gmail matches quoted phrases: whole words,
+    ignoring case and any punctuation or whitespace between them.
+    """
+    phrases = (r"\W+".join(map(re.escape, re.findall(r"\w+", term))) for term in terms)
+    return re.compile(r"\b(?:" + "|".join(phrases) + r")\b", re.IGNORECASE)
+
+
+CONFIRM_RE = _phrase_pattern(CONFIRM_TERMS)
+REJECT_RE = _phrase_pattern(REJECT_TERMS)
+
+# Separator used when appending rejection snippets to a job's job_text
+REJECTION_PREFIX = "\n[Rejection snippet] "
+
+# Stay well under SQLite's bound-parameter limit in IN (...) queries
+SQL_MAX_PARAMS = 500
+
+# Gmail caps a single batch request at 100 calls
+BATCH_SIZE = 100
+
+# Parallel fallback when batch requests are disabled or fail.
+# 10 workers keeps us comfortably under Gmail's per-user quota.
+FETCH_WORKERS = 10
+MAX_RETRIES = 5
+
+# Gmail reports per-user rate limiting as 403 with one of these reasons
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Network-level failures (timeouts, connection resets) worth retrying
+TRANSPORT_ERRORS = (OSError, httplib2.HttpLib2Error)
 
-def get_gmail_service():
+# httplib2 is not thread-safe, so each worker thread gets its own connection
+_thread_local = threading.local()
+
+
+def get_gmail_service(allow_browser: bool = True):
     """
     Load Gmail API credentials and return an authenticated service object.
-    On first run, opens a browser window to ask for permission.
+    On first run, opens a browser window to ask for permission, unless
+    allow_browser is False, in which case None is returned instead.
     """
     creds = None
     token_path = Path("token.json")
@@ -33,6 +118,8 @@ def get_gmail_service():
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
+        elif not allow_browser:
+            return None
         else:
             # credentials.json comes from Google Cloud Console
             flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
@@ -41,7 +128,8 @@ def get_gmail_service():
         with token_path.open("w") as token_file:
             token_file.write(creds.to_json())
 
-    service = build("gmail", "v1", credentials=creds)
+    # Bundled discovery document (already the default without a discoveryServiceUrl; kept explicit)
+    service = build("gmail", "v1", credentials=creds, cache_discovery=False, static_discovery=True)
     return service
 
 
@@ -59,14 +147,176 @@ def gmail_search(service, query: str, max_results: int = 200):
     return messages
 
 
-def get_header(headers, name: str) -> str:
+def batch_get_metadata(service, ids: list[str]) -> list[dict]:
+    """
+    Fetch From/Subject/Date metadata for many messages using Gmail batch
+    requests (one HTTP round trip per BATCH_SIZE messages).
+    Returns message dicts in the same order as `ids`; failed fetches are skipped.
+    """
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[request_id] = (response, exception)
+
+    for i in range(0, len(ids), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for mid in ids[i : i + BATCH_SIZE]:
+            req = service.users().messages().get(
+                userId="me",
+                id=mid,
+                format="metadata",
+                metadataHeaders=["From", "Subject", "Date"],
+            )
+            batch.add(req, request_id=mid)
+        try:
+            batch.execute()
+        except (HttpError, *TRANSPORT_ERRORS) as e:
+            print(f"  Batch request failed: {e}")
+
+    msgs = []
+    for mid in ids:
+        response, exception = results.get(mid, (None, None))
+        if exception is not None:
+            print(f"  Error fetching message {mid}: {exception}")
+            continue
+        if response is not None:
+            msgs.append(response)
+    return msgs
+
+
+def _thread_http(service):
+    """
+    Return an authorized http object owned by the current thread.
+    """
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = AuthorizedHttp(service._http.credentials, http=httplib2.Http())
+        _thread_local.http = http
+    return http
+
+
+def _is_retryable(e: HttpError) -> bool:
+    """
+    True for rate limits (429, or 403 with a rate-limit reason) and server errors (5xx).
+    """
+    status = e.resp.status
+    if status == 429 or status >= 500:
+        return True
+    if status != 403:
+        return False
+    try:
+        errors = json.loads(e.content)["error"]["errors"]
+        return any(err.get("reason") in RATE_LIMIT_REASONS for err in errors)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+
+
+def _fetch_one(service, mid: str) -> dict | None:
+    """
+    Fetch metadata for a single message, retrying with exponential backoff
+    on rate limits, server errors, and network failures.
+    """
+    request = service.users().messages().get(
+        userId="me",
+        id=mid,
+        format="metadata",
+        metadataHeaders=["From", "Subject", "Date"],
+    )
+    for attempt in range(MAX_RETRIES):
+        try:
+            return request.execute(http=_thread_http(service))
+        except (HttpError, *TRANSPORT_ERRORS) as e:
+            retryable = not isinstance(e, HttpError) or _is_retryable(e)
+            if retryable and attempt < MAX_RETRIES - 1:
+                time.sleep(2**attempt + random.random())
+                continue
+            print(f"  Error fetching message {mid}: {e}")
+            return None
+
+
+def threaded_get_metadata(service, ids: list[str]) -> list[dict]:
+    """
+    Fetch message metadata with a bounded thread pool, one request per message.
+    Returns message dicts in the same order as `ids`; failed fetches are skipped.
+    """
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+        msgs = list(ex.map(lambda mid: _fetch_one(service, mid), ids))
+    return [m for m in msgs if m is not None]
+
+
+def fetch_metadata(service, ids: list[str], use_batch: bool = True) -> list[dict]:
+    """
+    Fetch message metadata, preferring the batch endpoint. Messages the batch
+    couldn't fetch (or all of them, if batching is disabled) are fetched with
+    parallel single requests, which retry with backoff.
+    Returns message dicts in the same order as `ids`; failed fetches are skipped.
+    """
+    fetched = {}
+    if use_batch:
+        fetched = {msg["id"]: msg for msg in batch_get_metadata(service, ids)}
+
+    missing = [mid for mid in ids if mid not in fetched]
+    if missing:
+        if use_batch:
+            print(f"Retrying {len(missing)} message(s) with parallel fetches.")
+        fetched.update((msg["id"], msg) for msg in threaded_get_metadata(service, missing))
+
+    return [fetched[mid] for mid in ids if mid in fetched]
+
+
+def load_sync_state() -> dict:
     """
-    Extract a header value from Gmail message headers.
+    Load per-scan sync state ({scan: {"historyId": ..., "last_sync_epoch": ...}}).
     """
-    for h in headers:
-        if h.get("name", "").lower() == name.lower():
-            return h.get("value", "")
-    return ""
+    if SYNC_STATE_PATH.exists():
+        return json.loads(SYNC_STATE_PATH.read_text())
+    return {}
+
+
+def save_sync_state(state: dict):
+    SYNC_STATE_PATH.write_text(json.dumps(state, indent=2))
+
+
+def load_processed_ids() -> dict[str, set[str]]:
+    """
+    Load the message IDs already handled by each scan ({scan: set of IDs}).
+    """
+    if PROCESSED_IDS_PATH.exists():
+        data = json.loads(PROCESSED_IDS_PATH.read_text())
+        return {name: set(ids) for name, ids in data.items()}
+    return {}
+
+
+def save_processed_ids(processed: dict[str, set[str]]):
+    PROCESSED_IDS_PATH.write_text(json.dumps({name: sorted(ids) for name, ids in processed.items()}))
+
+
+def has_new_mail(service, history_id: str) -> bool:
+    """
+    Ask the Gmail history API whether any message was added since history_id.
+    Returns True if that history is no longer available, so the caller rescans.
+    """
+    try:
+        response = service.users().history().list(
+            userId="me",
+            startHistoryId=history_id,
+            historyTypes=["messageAdded"],
+        ).execute()
+    except HttpError as e:
+        if e.resp.status == 404:
+            return True  # history ID expired
+        raise
+    return bool(response.get("history")) or "nextPageToken" in response
+
+
+def date_filter(since_epoch: int | None) -> str:
+    """
+    Gmail query clause limiting results to mail after the last sync,
+    or the past year on a first (or --full) sync.
+    """
+    if since_epoch:
+        return f"after:{since_epoch}"
+    return "newer_than:365d"
 
 
 def parse_date(date_str: str) -> str:
@@ -81,93 +331,190 @@ def parse_date(date_str: str) -> str:
         return ""
 
 
-def load_jobs_df() -> pd.DataFrame:
-    """
-    Load jobs.csv if it exists, otherwise create an empty DataFrame
-    with the expected columns.
-    """
-    if JOBS_CSV.exists():
-        df = pd.read_csv(JOBS_CSV)
-    else:
-        df = pd.DataFrame(
-            columns=[
-                "company",
-                "role_title",
-                "job_link",
-                "applied_date",
-                "status",
-                "job_text",
-                "summary",
-                "skills",
-                "salary",
-            ]
-        )
+def parse_dates(date_strs: list[str]) -> list[str]:
+    """
+    Convert a list of Date headers to YYYY-MM-DD, parsing each distinct value once.
+    """
+    parsed = {d: parse_date(d) for d in set(date_strs)}
+    return [parsed[d] for d in date_strs]
 
-    # Ensure all expected columns exist
-    for col in [
-        "company",
-        "role_title",
-        "job_link",
-        "applied_date",
-        "status",
-        "job_text",
-        "summary",
-        "skills",
-        "salary",
-    ]:
-        if col not in df.columns:
-            df[col] = ""
 
-    return df
+def header_map(msg: dict) -> dict[str, str]:
+    """
+    Index a Gmail message's headers by lowercased name for O(1) lookups.
+    """
+    return {h.get("name", "").lower(): h.get("value", "") for h in msg.get("payload", {}).get("headers", [])}
 
 
-def save_jobs_df(df: pd.DataFrame):
-    df.to_csv(JOBS_CSV, index=False)
-    print(f"Saved jobs to {JOBS_CSV}")
+def message_fields(msgs: list[dict]) -> list[tuple[str, str, str, str]]:
+    """
+    Extract (subject, from, date, snippet) from fetched messages in one pass.
+    Headers are indexed once per message and dates are parsed in bulk.
+    """
+    header_maps = [header_map(msg) for msg in msgs]
+    dates = parse_dates([hmap.get("date", "") for hmap in header_maps])
+    return [
+        (hmap.get("subject", ""), hmap.get("from", ""), date, msg.get("snippet", ""))
+        for msg, hmap, date in zip(msgs, header_maps, dates)
+    ]
 
 
-def scan_confirmations(service, df: pd.DataFrame) -> pd.DataFrame:
+def load_jobs() -> list[dict]:
     """
-    Find application confirmation emails and add them to jobs.csv
-    if not already present.
+    Load jobs from jobs.csv as row dicts keyed by its header (so hand-added
+    columns are kept), or an empty list if it doesn't exist.
     """
-    print("Scanning for application confirmation emails...")
+    if not JOBS_CSV.exists():
+        return []
+    # utf-8-sig drops the BOM Excel adds, which would otherwise end up in the first header
+    with JOBS_CSV.open(newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        cols = [col for col in reader.fieldnames or [] if col]
+        return [{col: row.get(col) or "" for col in cols} for row in reader]
 
-    query = (
-        'subject:("application received" OR "thank you for applying" OR '
-        '"we received your application" OR "your application has been submitted") '
-        "newer_than:365d"
-    )
 
-    messages = gmail_search(service, query)
-    print(f"Found {len(messages)} potential confirmation emails.")
+def csv_signature() -> str | None:
+    """
+    Identify the current jobs.csv by mtime and size, or None if it doesn't exist.
+    """
+    if not JOBS_CSV.exists():
+        return None
+    st = JOBS_CSV.stat()
+    return f"{st.st_mtime_ns}:{st.st_size}"
 
-    for msg_meta in messages:
-        msg = service.users().messages().get(
-            userId="me",
-            id=msg_meta["id"],
-            format="metadata",
-            metadataHeaders=["From", "Subject", "Date"],
-        ).execute()
 
-        headers = msg.get("payload", {}).get("headers", [])
-        subject = get_header(headers, "Subject")
-        from_header = get_header(headers, "From")
-        date_header = get_header(headers, "Date")
-        snippet = msg.get("snippet", "")
+def recorded_csv_signature(conn: sqlite3.Connection) -> str | None:
+    """
+    Signature of jobs.csv as of the last time it was exported or imported.
+    """
+    row = conn.execute("SELECT value FROM meta WHERE key = 'csv_signature'").fetchone()
+    return row[0] if row else None
+
 
-        applied_date = parse_date(date_header)
+def record_csv_signature(conn: sqlite3.Connection):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('csv_signature', ?)", (csv_signature(),))
+    conn.commit()
 
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_columns(conn: sqlite3.Connection) -> list[str]:
+    return [r[1] for r in conn.execute("PRAGMA table_info(jobs)")]
+
+
+def add_columns(conn: sqlite3.Connection, cols):
+    """
+    Add any of `cols` the jobs table doesn't have yet (e.g. columns added to jobs.csv by hand).
+    """
+    existing = {c.lower() for c in table_columns(conn)}
+    for col in cols:
+        if col and col.lower() not in existing:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {quote_ident(col)} TEXT")
+            existing.add(col.lower())
+
+
+def open_jobs_db() -> sqlite3.Connection:
+    """
+    Open jobs.db, creating the jobs table on first use. A legacy jobs.csv
+    is imported into an empty table, and a jobs.csv edited since it was
+    last exported replaces the table's contents.
+    """
+    conn = sqlite3.connect(JOBS_DB)
+    # The UNIQUE index also serves role_title lookups (leftmost column)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            company TEXT,
+            role_title TEXT,
+            job_link TEXT,
+            applied_date TEXT,
+            status TEXT,
+            job_text TEXT,
+            summary TEXT,
+            skills TEXT,
+            salary TEXT,
+            job_description TEXT,
+            UNIQUE(role_title, applied_date)
+        )
+        """
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    # Tables created by older versions may be missing newer columns
+    add_columns(conn, EXPECTED_COLS)
+
+    empty = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
+    recorded = recorded_csv_signature(conn)
+    if empty and JOBS_CSV.exists():
+        print(f"Migrating {JOBS_CSV} to {JOBS_DB}")
+        insert_jobs(conn, load_jobs())
+        record_csv_signature(conn)
+    elif recorded is not None and recorded != csv_signature() and JOBS_CSV.exists():
+        # The edited file is authoritative, so renamed and deleted rows carry
+        # over as-is; replace everything in one transaction
+        with conn:
+            conn.execute("DELETE FROM jobs")
+            written = insert_jobs(conn, load_jobs())
+        print(f"Replaced {JOBS_DB} with {written} job(s) from edited {JOBS_CSV}")
+        record_csv_signature(conn)
+
+    return conn
+
+
+def insert_jobs(conn: sqlite3.Connection, rows: list[dict]) -> int:
+    """
+    Insert job rows (all with the same keys), adding any columns the table
+    lacks and ignoring any whose (role_title, applied_date) already exists.
+    Returns the number of rows actually inserted.
+    """
+    if not rows:
+        return 0
+    cols = list(rows[0])
+    add_columns(conn, cols)
+
+    names = ", ".join(map(quote_ident, cols))
+    placeholders = ", ".join("?" * len(cols))
+    before = conn.total_changes
+    conn.executemany(f"INSERT OR IGNORE INTO jobs ({names}) VALUES ({placeholders})", [[row.get(c, "") for c in cols] for row in rows])
+    return conn.total_changes - before
+
+
+def export_csv(conn: sqlite3.Connection):
+    """
+    Write every column of the jobs table to jobs.csv. A jobs.csv this script
+    didn't write (e.g. from an older version) is backed up first.
+    """
+    recorded = recorded_csv_signature(conn)
+    if JOBS_CSV.exists() and (recorded is None or recorded != csv_signature()):
+        backup = JOBS_CSV.with_name(f"{JOBS_CSV.name}.{datetime.now():%Y%m%d-%H%M%S}.bak")
+        JOBS_CSV.replace(backup)
+        print(f"Backed up existing {JOBS_CSV} to {backup}")
+
+    cur = conn.execute("SELECT * FROM jobs ORDER BY rowid")
+    cols = [d[0] for d in cur.description]
+    rows = cur.fetchall()
+    with JOBS_CSV.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(cols)
+        writer.writerows([["" if v is None else v for v in row] for row in rows])
+    record_csv_signature(conn)
+    print(f"Exported {len(rows)} job(s) to {JOBS_CSV}")
+
+
+def record_confirmations(conn: sqlite3.Connection, fields: list[tuple[str, str, str, str]]) -> tuple[int, int]:
+    """
+    Add confirmation emails to the jobs table if not already present.
+    Returns (number of rows added, number of existing rows updated).
+    """
+    new_rows: list[dict] = []
+
+    for subject, from_header, applied_date, snippet in fields:
         # Simple heuristic:
         company = from_header  # you can manually clean later
         role_title = subject
         job_text = snippet
 
-        # Check if we already have this role_title + applied_date
-        dup_mask = (df["role_title"] == role_title) & (df["applied_date"] == applied_date)
-        if dup_mask.any():
-            continue  # already recorded
-
         row = {
             "company": company,
             "role_title": role_title,
@@ -179,89 +526,260 @@ def scan_confirmations(service, df: pd.DataFrame) -> pd.DataFrame:
             "skills": "",
             "salary": "",
         }
-        df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+        new_rows.append(row)
 
-    return df
+    # Rows with a role_title + applied_date we already have are skipped by the UNIQUE index
+    return insert_jobs(conn, new_rows), 0
 
 
-def scan_rejections(service, df: pd.DataFrame) -> pd.DataFrame:
+def record_rejections(conn: sqlite3.Connection, fields: list[tuple[str, str, str, str]]) -> tuple[int, int]:
     """
-    Find rejection emails and mark matching jobs as Rejected
-    (or add new rows if we can't match).
+    Mark jobs matching rejection emails as Rejected (or add new rows if we can't match).
+    Returns (number of rows added, number of existing rows updated).
     """
-    print("Scanning for rejection emails...")
+    # Group emails by subject so each job is written once with all of its snippets
+    by_subject: dict[str, list[tuple[str, str, str]]] = {}
+    for subject, from_header, rejection_date, snippet in fields:
+        by_subject.setdefault(subject, []).append((from_header, rejection_date, snippet))
+
+    # Match by exact subject (most ATS keep same subject in thread)
+    subjects = list(by_subject)
+    existing = set()
+    for i in range(0, len(subjects), SQL_MAX_PARAMS):
+        chunk = subjects[i : i + SQL_MAX_PARAMS]
+        placeholders = ", ".join("?" * len(chunk))
+        existing.update(
+            r[0] for r in conn.execute(f"SELECT DISTINCT role_title FROM jobs WHERE role_title IN ({placeholders})", chunk)
+        )
 
-    query = (
-        '("regret to inform you" OR "decided not to move forward" OR '
-        '"unfortunately we will not be moving forward" OR '
-        '"after careful consideration, we have decided") newer_than:365d'
+    # Append the rejection snippets to job_text of matching jobs, in one statement
+    updates = [
+        ("".join(REJECTION_PREFIX + snippet for _, _, snippet in emails), subject)
+        for subject, emails in by_subject.items()
+        if subject in existing
+    ]
+    cur = conn.executemany(
+        """
+        UPDATE jobs
+        SET status = 'Rejected',
+            job_text = COALESCE(job_text, '') || ?
+        WHERE role_title = ?
+        """,
+        updates,
     )
+    updated = cur.rowcount if updates else 0
+
+    # If we can't find a match, add a new row from the first email
+    new_rows: list[dict] = []
+    for subject, emails in by_subject.items():
+        if subject in existing:
+            continue
+        from_header, rejection_date, snippet = emails[0]
+        row = {
+            "company": from_header,
+            "role_title": subject,
+            "job_link": "",
+            "applied_date": rejection_date,
+            "status": "Rejected",
+            "job_text": snippet + "".join(REJECTION_PREFIX + s for _, _, s in emails[1:]),
+            "summary": "",
+            "skills": "",
+            "salary": "",
+        }
+        new_rows.append(row)
 
+    return insert_jobs(conn, new_rows), updated
+
+
+def is_confirmation(subject: str) -> bool:
+    """
+    Local equivalent of the confirmation query (which only searches subjects).
+    """
+    return CONFIRM_RE.search(subject) is not None
+
+
+def is_rejection(subject: str, snippet: str) -> bool:
+    """
+    Local equivalent of the rejection query, limited to the subject and snippet.
+    """
+    return REJECT_RE.search(subject) is not None or REJECT_RE.search(snippet) is not None
+
+
+def fetch_new_messages(
+    service, query: str, processed: set[str], label: str, use_batch: bool = True
+) -> tuple[list[dict], int]:
+    """
+    Search Gmail and fetch metadata for results not already in `processed`.
+    Returns (fetched messages, number of messages that couldn't be fetched).
+    """
     messages = gmail_search(service, query)
-    print(f"Found {len(messages)} potential rejection emails.")
+    new_msgs = [m for m in messages if m["id"] not in processed]
+    print(f"Found {len(messages)} potential {label} emails ({len(new_msgs)} new).")
+    msgs = fetch_metadata(service, [m["id"] for m in new_msgs], use_batch=use_batch)
+    return msgs, len(new_msgs) - len(msgs)
+
+
+def scan_confirmations(
+    service,
+    conn: sqlite3.Connection,
+    processed: set[str],
+    use_batch: bool = True,
+    since_epoch: int | None = None,
+) -> tuple[int, int, int]:
+    """
+    Find application confirmation emails and add them to the jobs table
+    if not already present. Messages in `processed` are skipped, and
+    newly handled message IDs are added to it.
+    Returns (number of rows added, number of existing rows updated,
+    number of messages that couldn't be fetched).
+    """
+    print("Scanning for application confirmation emails...")
 
-    for msg_meta in messages:
-        msg = service.users().messages().get(
-            userId="me",
-            id=msg_meta["id"],
-            format="metadata",
-            metadataHeaders=["From", "Subject", "Date"],
-        ).execute()
+    query = f"{QUERY_CONFIRM_TERMS} {date_filter(since_epoch)}"
+    msgs, failed = fetch_new_messages(service, query, processed, "confirmation", use_batch=use_batch)
 
-        headers = msg.get("payload", {}).get("headers", [])
-        subject = get_header(headers, "Subject")
-        from_header = get_header(headers, "From")
-        date_header = get_header(headers, "Date")
-        snippet = msg.get("snippet", "")
+    added, updated = record_confirmations(conn, message_fields(msgs))
+    processed.update(msg["id"] for msg in msgs)
+    return added, updated, failed
 
-        rejection_date = parse_date(date_header)
 
-        # Try to match by exact subject (most ATS keep same subject in thread)
-        mask = df["role_title"] == subject
+def scan_rejections(
+    service,
+    conn: sqlite3.Connection,
+    processed: set[str],
+    use_batch: bool = True,
+    since_epoch: int | None = None,
+) -> tuple[int, int, int]:
+    """
+    Find rejection emails and mark matching jobs as Rejected
+    (or add new rows if we can't match). Messages in `processed` are
+    skipped, and newly handled message IDs are added to it.
+    Returns (number of rows added, number of existing rows updated,
+    number of messages that couldn't be fetched).
+    """
+    print("Scanning for rejection emails...")
 
-        if mask.any():
-            df.loc[mask, "status"] = "Rejected"
-            # Optionally append the rejection snippet to job_text
-            df.loc[mask, "job_text"] = (
-                df.loc[mask, "job_text"].fillna("").astype(str) + "\n[Rejection snippet] " + snippet
-            )
-        else:
-            # If we can't find a match, add a new row
-            row = {
-                "company": from_header,
-                "role_title": subject,
-                "job_link": "",
-                "applied_date": rejection_date,
-                "status": "Rejected",
-                "job_text": snippet,
-                "summary": "",
-                "skills": "",
-                "salary": "",
-            }
-            df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-
-    return df
+    query = f"{QUERY_REJECT_TERMS} {date_filter(since_epoch)}"
+    msgs, failed = fetch_new_messages(service, query, processed, "rejection", use_batch=use_batch)
+
+    added, updated = record_rejections(conn, message_fields(msgs))
+    processed.update(msg["id"] for msg in msgs)
+    return added, updated, failed
+
+
+def scan_all(
+    service,
+    conn: sqlite3.Connection,
+    processed: set[str],
+    use_batch: bool = True,
+    since_epoch: int | None = None,
+) -> tuple[int, int, int]:
+    """
+    Find confirmation and rejection emails with a single search and metadata
+    fetch, then sort them locally. Confirmations are recorded before
+    rejections, matching scan_confirmations followed by scan_rejections.
+    Returns (number of rows added, number of existing rows updated,
+    number of messages that couldn't be fetched).
+    """
+    print("Scanning for application confirmation and rejection emails...")
+
+    query = f"({QUERY_CONFIRM_TERMS} OR {QUERY_REJECT_TERMS}) {date_filter(since_epoch)}"
+    msgs, failed = fetch_new_messages(service, query, processed, "confirmation/rejection", use_batch=use_batch)
+
+    confirmations, rejections = [], []
+    for fields in message_fields(msgs):
+        subject, _, _, snippet = fields
+        confirmed = is_confirmation(subject)
+        if confirmed:
+            confirmations.append(fields)
+        # Anything that isn't a confirmation can only have matched the rejection
+        # query, even if the phrase is past the snippet
+        if not confirmed or is_rejection(subject, snippet):
+            rejections.append(fields)
+
+    added, updated = record_confirmations(conn, confirmations)
+    r_added, r_updated = record_rejections(conn, rejections)
+    processed.update(msg["id"] for msg in msgs)
+    return added + r_added, updated + r_updated, failed
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Sync job applications from Gmail into jobs.csv")
+    parser = argparse.ArgumentParser(description="Sync job applications from Gmail into jobs.db")
     parser.add_argument(
         "mode",
-        choices=["scan-confirmations", "scan-rejections", "scan-all"],
-        help="What to scan: confirmations, rejections, or both.",
+        choices=["scan-confirmations", "scan-rejections", "scan-all", "export-csv"],
+        help="What to scan (confirmations, rejections, or both), or export the jobs to jobs.csv.",
+    )
+    parser.add_argument(
+        "--no-batch",
+        action="store_true",
+        help="Fetch messages with parallel single requests instead of Gmail batch requests.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the last sync and already-processed messages, and rescan the past 365 days.",
+    )
+    parser.add_argument(
+        "--no-browser",
+        action="store_true",
+        help="Exit instead of opening a browser if there is no saved Gmail token (e.g. for cron).",
     )
     args = parser.parse_args()
 
-    service = get_gmail_service()
-    df = load_jobs_df()
-
-    if args.mode in ("scan-confirmations", "scan-all"):
-        df = scan_confirmations(service, df)
-
-    if args.mode in ("scan-rejections", "scan-all"):
-        df = scan_rejections(service, df)
+    conn = open_jobs_db()
+
+    if args.mode == "export-csv":
+        export_csv(conn)
+        return
+
+    service = get_gmail_service(allow_browser=not args.no_browser)
+    if service is None:
+        print("No valid Gmail token in token.json; run once without --no-browser to authorize.")
+        return
+
+    scans = {
+        "scan-confirmations": ("confirmations", scan_confirmations),
+        "scan-rejections": ("rejections", scan_rejections),
+        "scan-all": ("all", scan_all),
+    }
+    name, scan = scans[args.mode]
+
+    state = load_sync_state()
+    last = {} if args.full else state.get(name, {})
+    if last.get("historyId") and not has_new_mail(service, last["historyId"]):
+        print(f"No new mail since the last {name} scan, nothing to do.")
+        return
+
+    # Taken before scanning so mail arriving mid-sync is picked up next time
+    history_id = service.users().getProfile(userId="me").execute()["historyId"]
+    sync_start = int(time.time())
+
+    processed = load_processed_ids()
+    if args.full:
+        # Refetch everything so a lost or reset jobs.db can be rebuilt
+        processed[name] = set()
+    added, updated, failed = scan(
+        service,
+        conn,
+        processed.setdefault(name, set()),
+        use_batch=not args.no_batch,
+        since_epoch=last.get("last_sync_epoch"),
+    )
 
-    save_jobs_df(df)
+    conn.commit()
+    print(f"Added {added} new job(s), updated {updated} existing job(s) in {JOBS_DB}.")
+    # Keep jobs.csv (job_tracker.py's default input) in step with jobs.db
+    if added or updated:
+        export_csv(conn)
+    conn.close()
+    save_processed_ids(processed)
+    if failed:
+        # Keep the old window so the next run's search still finds (and retries) them
+        print(f"{failed} message(s) couldn't be fetched; they will be retried on the next run.")
+        return
+    state[name] = {"historyId": history_id, "last_sync_epoch": sync_start}
+    save_sync_state(state)
 
 
 if __name__ == "__main__":
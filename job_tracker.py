@@ -1,10 +1,31 @@
+from __future__ import annotations
+
 import os
+import json
+import time
+import hashlib
+import random
 import argparse
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, RateLimitError
+
+MODEL = "gpt-5.1-mini"
+
+# Number of summarization requests in flight at once
+SUMMARY_WORKERS = 8
+MAX_RETRIES = 5
+
+# Jobs packed into a single summarization request
+JOBS_PER_REQUEST = 10
+
+# Past API answers, keyed by a hash of the model and single-job prompt
+CACHE_DIR = Path(".job_summary_cache")
 
 
 def load_api_client() -> OpenAI:
@@ -18,21 +39,23 @@ def load_api_client() -> OpenAI:
     return OpenAI(api_key=api_key)
 
 
-def build_prompt(row: pd.Series) -> str:
+def combined_job_text(job_text: str, job_description: str = "") -> str:
     """
-    Build a prompt for a single job row.
-    Expects columns: company, role_title, job_text, job_description (optional).
+    Combine the pasted job description and email snippet for one job.
     """
-    company = row.get("company", "") or ""
-    role_title = row.get("role_title", "") or ""
-    job_text = row.get("job_text", "") or ""
-    job_description = row.get("job_description", "") or ""
-
     # Combine description + email snippet
     combined_text = (job_description + "\n\n" + job_text).strip()
 
     if not combined_text:
         combined_text = "(No job description text provided. Infer as best you can from the title and company.)"
+    return combined_text
+
+
+def build_prompt(company: str, role_title: str, job_text: str, job_description: str = "") -> str:
+    """
+    Build a prompt for a single job from its company, title, and text fields.
+    """
+    combined_text = combined_job_text(job_text, job_description)
 
     return f"""
 You are helping a student track their job applications.
@@ -63,62 +86,279 @@ Return your answer as JSON with this exact structure:
 """
 
 
-def summarize_job(client: OpenAI, row: pd.Series) -> dict:
+def build_batch_prompt(jobs: list[dict]) -> str:
+    """
+    Build a single prompt asking for summaries of several jobs at once.
+    Each job is a dict with the build_prompt() arguments as keys.
+    Jobs are numbered 0..K-1 and the answer is keyed by that id.
     """
-    Call the OpenAI API to summarize one job row.
+    sections = []
+    for i, job in enumerate(jobs):
+        sections.append(
+            f"""Job {i}
+Job title: {job["role_title"]}
+Company: {job["company"]}
+Text:
+---
+{combined_job_text(job["job_text"], job.get("job_description", ""))}
+---"""
+        )
+    jobs_text = "\n\n".join(sections)
+
+    return f"""
+You are helping a student track their job applications.
+
+Below are {len(jobs)} jobs, numbered 0 to {len(jobs) - 1}, each with some related text
+(description, notes, or emails):
+
+{jobs_text}
+
+For EACH job:
+
+1) Write a single-sentence summary of what this job is about. Maximum 25 words.
+2) List 3–8 key skills or keywords the role seems to care about.
+3) If a salary or salary range is mentioned, extract it as a short string
+   (for example: "$30–35/hr" or "$95k–115k + bonus").
+   If not mentioned, use "unknown".
+
+Return your answer as JSON with this exact structure, one entry per job:
+
+{{
+  "results": [
+    {{"id": 0, "summary": "one-line summary here", "skills": ["Skill1", "Skill2"], "salary": "salary or 'unknown'"}}
+  ]
+}}
+"""
+
+
+def cache_path(job: dict) -> Path:
+    """
+    Cache file for a job, addressed by the sha256 of the model and its
+    single-job prompt (so switching models doesn't reuse old answers).
+    """
+    key = hashlib.sha256(f"{MODEL}\n{build_prompt(**job)}".encode("utf-8")).hexdigest()
+    return CACHE_DIR / f"{key}.json"
+
+
+def load_cached_summary(job: dict) -> dict | None:
+    """
+    Cached answer for a job, or None if there is none or it can't be read
+    (a corrupt entry is just a cache miss and gets overwritten).
+    """
+    try:
+        cached = json.loads(cache_path(job).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return cached if isinstance(cached, dict) else None
+
+
+def save_cached_summary(job: dict, result: dict) -> None:
+    if not isinstance(result, dict):
+        return
+    CACHE_DIR.mkdir(exist_ok=True)
+    # Write then rename, so an interrupted run never leaves a half-written entry
+    path = cache_path(job)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(result), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def summarize_job(client: OpenAI, job: dict) -> dict:
+    """
+    Call the OpenAI API to summarize one job (or return its cached answer).
     Returns a dict with keys: summary, skills, salary.
     """
-    prompt = build_prompt(row)
+    cached = load_cached_summary(job)
+    if cached is not None:
+        return cached
+
+    prompt = build_prompt(**job)
 
     response = client.responses.create(
-        model="gpt-5.1-mini",
+        model=MODEL,
         input=prompt,
         response_format={"type": "json_object"},
     )
 
     # Extract parsed JSON from the first output
     parsed = response.output[0].content[0].parsed
+    save_cached_summary(job, parsed)
     return parsed
 
 
+def summarize_jobs_batch(client: OpenAI, jobs: list[dict]) -> list[dict | None]:
+    """
+    Call the OpenAI API once to summarize several jobs.
+    Returns one dict (summary, skills, salary) per job, in order, with None
+    for any job the response left out.
+    Raises ValueError if the response has no usable 'results' list.
+    """
+    prompt = build_batch_prompt(jobs)
+
+    response = client.responses.create(
+        model=MODEL,
+        input=prompt,
+        response_format={"type": "json_object"},
+    )
+
+    parsed = response.output[0].content[0].parsed
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("results"), list):
+        raise ValueError("batched response is missing a 'results' list")
+
+    # Models sometimes echo ids back as strings ("0"); skip any that aren't numbers
+    by_id = {}
+    for item in parsed["results"]:
+        if not isinstance(item, dict):
+            continue
+        try:
+            by_id[int(item.get("id"))] = item
+        except (TypeError, ValueError):
+            continue
+    return [by_id.get(i) for i in range(len(jobs))]
+
+
+def with_retry(fn, *args):
+    """
+    Call fn(*args) with exponential backoff on OpenAI rate limits.
+    """
+    for attempt in range(MAX_RETRIES):
+        try:
+            return fn(*args)
+        except RateLimitError:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(2**attempt + random.random())
+
+
+def summarize_chunk(client: OpenAI, chunk: list[tuple]) -> list[tuple]:
+    """
+    Summarize a chunk of (idx, job) pairs with one batched request, falling back
+    to one request per job for jobs the batched answer is missing (or for the
+    whole chunk if it can't be parsed at all).
+    Returns (idx, result, error) tuples.
+    """
+    out = []
+    retry = chunk
+    try:
+        results = with_retry(summarize_jobs_batch, client, [job for _, job in chunk])
+        retry = []
+        for (idx, job), result in zip(chunk, results):
+            if result is None:
+                retry.append((idx, job))
+                continue
+            save_cached_summary(job, result)
+            out.append((idx, result, None))
+        if retry:
+            print(f"  Batched summary skipped {len(retry)} job(s); summarizing them one by one.")
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"  Batched summary failed ({e}); summarizing {len(chunk)} job(s) one by one.")
+
+    for idx, job in retry:
+        try:
+            out.append((idx, with_retry(summarize_job, client, job), None))
+        except Exception as e:
+            out.append((idx, None, e))
+    return out
+
+
+def text_column(df: pd.DataFrame, col: str):
+    """
+    Return a column as a numpy array of strings (missing column / NaN -> "").
+    """
+    if col not in df.columns:
+        return np.full(len(df), "", dtype=object)
+    return df[col].fillna("").astype(str).to_numpy()
+
+
+def apply_result(df: pd.DataFrame, idx, result: dict) -> None:
+    """
+    Write a summarize_job result into the summary/skills/salary columns of one row.
+    """
+    df.at[idx, "summary"] = result.get("summary", "")
+
+    skills_list = result.get("skills", [])
+    if isinstance(skills_list, list):
+        df.at[idx, "skills"] = ", ".join(skills_list)
+    else:
+        df.at[idx, "skills"] = str(skills_list)
+
+    df.at[idx, "salary"] = result.get("salary", "")
+
+
 def process_jobs(input_path: Path, output_path: Path) -> None:
     """
     Read jobs from CSV, summarize missing ones, and write updated CSV.
     """
     client = load_api_client()
 
-    df = pd.read_csv(input_path)
+    # Read everything as text: all-empty columns would otherwise come back as
+    # float64 and reject the summary strings written into them
+    df = pd.read_csv(input_path, dtype=str, keep_default_na=False)
 
     # Ensure these columns exist
     for col in ["summary", "skills", "salary", "job_description"]:
         if col not in df.columns:
             df[col] = ""
 
+    # Pull the needed columns out once instead of building a Series per row
+    companies = text_column(df, "company")
+    titles = text_column(df, "role_title")
+    texts = text_column(df, "job_text")
+    descriptions = text_column(df, "job_description")
+
+    # Only summarize rows where summary is empty / whitespace
+    needs_summary = df["summary"].fillna("").astype(str).str.strip().eq("").to_numpy()
+
+    todo = []
+    for i in np.flatnonzero(needs_summary):
+        job = {
+            "company": companies[i],
+            "role_title": titles[i],
+            "job_text": texts[i],
+            "job_description": descriptions[i],
+        }
+        todo.append((df.index[i], job))
+
     updated = 0
 
-    for idx, row in df.iterrows():
-        # Only summarize rows where summary is empty / whitespace
-        existing_summary = str(row.get("summary", "") or "").strip()
-        if existing_summary:
+    # Reuse earlier answers for identical prompts instead of paying for them again
+    uncached = []
+    for idx, job in todo:
+        cached = load_cached_summary(job)
+        if cached is None:
+            uncached.append((idx, job))
             continue
-
-        print(f"Summarizing: {row.get('company', '')} - {row.get('role_title', '')} ...")
         try:
-            result = summarize_job(client, row)
-
-            df.at[idx, "summary"] = result.get("summary", "")
-
-            skills_list = result.get("skills", [])
-            if isinstance(skills_list, list):
-                df.at[idx, "skills"] = ", ".join(skills_list)
-            else:
-                df.at[idx, "skills"] = str(skills_list)
-
-            df.at[idx, "salary"] = result.get("salary", "")
-
+            apply_result(df, idx, cached)
             updated += 1
         except Exception as e:
             print(f"  Error summarizing row {idx}: {e}")
+    if updated:
+        print(f"Using cached summaries for {updated} job(s).")
+
+    with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) as ex:
+        futures = {}
+        for i in range(0, len(uncached), JOBS_PER_REQUEST):
+            chunk = uncached[i : i + JOBS_PER_REQUEST]
+            for _, job in chunk:
+                print(f"Summarizing: {job['company']} - {job['role_title']} ...")
+            futures[ex.submit(summarize_chunk, client, chunk)] = chunk
+
+        for fut in as_completed(futures):
+            try:
+                results = fut.result()
+            except Exception as e:
+                results = [(idx, None, e) for idx, _ in futures[fut]]
+
+            for idx, result, error in results:
+                if error is None:
+                    try:
+                        apply_result(df, idx, result)
+                        updated += 1
+                        continue
+                    except Exception as e:
+                        error = e
+                print(f"  Error summarizing row {idx}: {error}")
 
     df.to_csv(output_path, index=False)
     print(f"\nDone. Updated {updated} job(s).")